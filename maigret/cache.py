@@ -0,0 +1,158 @@
+"""Maigret Cache Module
+
+This module supports storing results of queries between runs, so the same
+username is not searched again on the same sites, and an interrupted search
+can be resumed.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+
+default_cache_path = os.path.join("~", ".maigret", "cache.db")
+
+default_cache_ttl = 3600
+
+default_state_path = os.path.join("~", ".maigret", "state.db")
+
+default_state_ttl = 24 * 3600
+
+default_state_commit_batch = 32
+
+
+def sites_fingerprint(site_names, tags=None):
+    """Get Sites Fingerprint.
+
+    Keyword Arguments:
+    site_names             -- Iterable of strings which identify sites.
+    tags                   -- Set of strings containing tags of sites.
+                              Default is None.
+
+    Return Value:
+    String identifying the set of sites used for the search.
+    """
+
+    fingerprint = hashlib.blake2b()
+    for site_name in sorted(site_names):
+        fingerprint.update(site_name.encode("utf-8") + b"\n")
+    for tag in sorted(tags or []):
+        fingerprint.update(b"#" + tag.encode("utf-8") + b"\n")
+
+    return fingerprint.hexdigest()
+
+
+class ResultsCache():
+    def __init__(self, path=default_cache_path, ttl=default_cache_ttl,
+                 commit_batch=1):
+        """Create Results Cache Object.
+
+        Contains results of username searches saved in the SQLite database.
+
+        Keyword Arguments:
+        self                   -- This object.
+        path                   -- String which indicates path to database file.
+                                  Default is in the ".maigret" folder of the
+                                  user home directory.
+        ttl                    -- Time (in seconds) while saved results are
+                                  valid.
+                                  Default of 1 hour.
+        commit_batch           -- Number of saved results committed to the
+                                  database at once, the rest of them are
+                                  committed when the cache is closed.
+                                  Default of 1.
+
+        Return Value:
+        Nothing.
+        """
+
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.ttl = ttl
+        self.commit_batch = commit_batch
+        self.uncommitted = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results "
+                                "(key TEXT PRIMARY KEY, ts REAL, results BLOB)")
+
+        return
+
+    def key(self, username, id_type, sites_hash, ids_search=False):
+        """Get Cache Key.
+
+        Keyword Arguments:
+        self                   -- This object.
+        username               -- String indicating username that was searched.
+        id_type                -- String indicating type of the username.
+        sites_hash             -- String identifying sites of the search,
+                                  see sites_fingerprint().
+        ids_search             -- Boolean indicating if the pages were
+                                  searched for other usernames.
+                                  Default is False.
+
+        Return Value:
+        String key of the search results.
+        """
+
+        key = f"{username.lower()}|{id_type}|{sites_hash}|{int(bool(ids_search))}"
+
+        return hashlib.blake2b(key.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Get Results.
+
+        Keyword Arguments:
+        self                   -- This object.
+        key                    -- String key of the search results.
+
+        Return Value:
+        Dictionary containing results of the search, or None if there are
+        no valid results saved.
+        """
+
+        row = self.connection.execute("SELECT results FROM results "
+                                      "WHERE key = ? AND ts > ?",
+                                      (key, time.time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+
+        return pickle.loads(row[0])
+
+    def set(self, key, results):
+        """Save Results.
+
+        Keyword Arguments:
+        self                   -- This object.
+        key                    -- String key of the search results.
+        results                -- Dictionary containing results of the search.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                                (key, time.time(), pickle.dumps(results)))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_batch:
+            self.connection.commit()
+            self.uncommitted = 0
+
+        return
+
+    def close(self):
+        """Close Cache.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+        return
+
@@ -14,23 +14,31 @@ import json
 import logging
 import os
 import platform
-import re
 import ssl
 import sys
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from time import monotonic
-from http.cookies import SimpleCookie
-import http.cookiejar as cookielib
 
 import requests
 from socid_extractor import parse, extract
 
-from requests_futures.sessions import FuturesSession
 from torrequest import TorRequest
+
+try:
+    import aiodns
+except ImportError:
+    # Optional dependency, aiohttp resolves hosts in a thread pool without it
+    aiodns = None
+
 from result import QueryStatus
 from result import QueryResult
-from notify import QueryNotifyPrint
-from sites  import SitesInformation
+from notify import QueryNotifyPrint, QueryNotifyDeferred, QueryNotifyUpdates
+from sites  import SitesInformation, SiteCheckInformation, group_sites_by_type
+from cache  import ResultsCache, sites_fingerprint
+from cache  import default_state_path, default_state_ttl, default_state_commit_batch
 
 module_name = "Maigret (Sherlock fork): Find Usernames Across Social Networks"
 __version__ = "0.12.2"
@@ -51,70 +59,119 @@ common_errors = {
 
 unsupported_characters = '#'
 
-cookies_file = 'cookies.txt'
-
-class SherlockFuturesSession(FuturesSession):
-    def request(self, method, url, hooks={}, *args, **kwargs):
-        """Request URL.
-
-        This extends the FuturesSession request method to calculate a response
-        time metric to each request.
-
-        It is taken (almost) directly from the following StackOverflow answer:
-        https://github.com/ross/requests-futures#working-in-the-background
-
-        Keyword Arguments:
-        self                   -- This object.
-        method                 -- String containing method desired for request.
-        url                    -- String containing URL for request.
-        hooks                  -- Dictionary containing hooks to execute after
-                                  request finishes.
-        args                   -- Arguments.
-        kwargs                 -- Keyword arguments.
-
-        Return Value:
-        Request object.
-        """
-        #Record the start time for the request.
-        start = monotonic()
-
-        def response_time(resp, *args, **kwargs):
-            """Response Time Hook.
-
-            Keyword Arguments:
-            resp                   -- Response object.
-            args                   -- Arguments.
-            kwargs                 -- Keyword arguments.
-
-            Return Value:
-            N/A
-            """
-            resp.elapsed = monotonic() - start
-
-            return
-
-        #Install hook to execute when response completes.
-        #Make sure that the time measurement hook is first, so we will not
-        #track any later hook's execution time.
-        try:
-            if isinstance(hooks['response'], list):
-                hooks['response'].insert(0, response_time)
-            elif isinstance(hooks['response'], tuple):
-                #Convert tuple to list and insert time measurement hook first.
-                hooks['response'] = list(hooks['response'])
-                hooks['response'].insert(0, response_time)
-            else:
-                #Must have previously contained a single hook function,
-                #so convert to list.
-                hooks['response'] = [response_time, hooks['response']]
-        except KeyError:
-            #No response hook was already defined, so install it ourselves.
-            hooks['response'] = [response_time]
 
-        return super(SherlockFuturesSession, self).request(method,
-                                                           url,
-                                                           hooks=hooks,
-                                                           *args, **kwargs)
+# Reports are written at once, so the buffer fits the whole file
+csv_buffer_size = 1 << 20
+
+csv_header = (
+    'username',
+    'name',
+    'url_main',
+    'url_user',
+    'exists',
+    'http_status',
+    'response_time_s',
+)
+
+default_max_workers = 64
+
+default_usernames_workers = 4
+
+# Several sites can be hosted on the same host (e.g. different templates of
+# one service), don't hammer it with all the simultaneous requests
+default_limit_per_host = 2
+
+# Pages smaller than that are parsed for ids inplace, it's cheaper than
+# sending them to the separate process
+extract_inline_max_size = 16 * 1024
+
+# Parsing of pages for ids is CPU-bound, so it is made in separate processes
+# to not block processing of other sites responses
+extract_executor = ProcessPoolExecutor(max_workers=2)
+
+def create_session(pool_size=default_max_workers):
+    """Create HTTP Session.
+
+    One connection pool shared by all the requests of a run: keep-alive
+    sockets, TLS sessions and resolved hosts are reused instead of cold
+    connects per site and per username.  Every host is resolved once for
+    the run and gets a limited number of simultaneous connections.
+
+    Keyword Arguments:
+    pool_size              -- Maximum number of simultaneously open connections.
+
+    Return Value:
+    aiohttp.ClientSession object, must be closed by the caller.
+    """
+    # Resolve hosts with c-ares instead of a thread per lookup, if available
+    resolver = aiohttp.AsyncResolver() if aiodns is not None else None
+    connector = aiohttp.TCPConnector(ssl=False, limit=pool_size,
+                                     limit_per_host=default_limit_per_host,
+                                     use_dns_cache=True, ttl_dns_cache=600,
+                                     resolver=resolver)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def status_code_is_success(status_code):
+    """Check Status Code.
+
+    Keyword Arguments:
+    status_code            -- Integer HTTP status code of response.
+
+    Return Value:
+    Boolean indicating if the status code is 2XX.
+    """
+    return 200 <= status_code < 300
+
+
+def claim_or_available(is_claimed, username, site_name, url, query_time=None):
+    """Get Query Result Of Detection.
+
+    Keyword Arguments:
+    is_claimed             -- Boolean indicating if the username was detected.
+    username               -- String indicating username that query result
+                              was about.
+    site_name              -- String which identifies site.
+    url                    -- String containing URL for username on site.
+    query_time             -- Time (in seconds) required to perform query.
+                              Default of None.
+
+    Return Value:
+    QueryResult() object with CLAIMED or AVAILABLE status.
+    """
+    if is_claimed:
+        status = QueryStatus.CLAIMED
+    else:
+        status = QueryStatus.AVAILABLE
+
+    return QueryResult(username, site_name, url, status, query_time=query_time)
+
+
+# Known errors of requests, subclasses are resolved by their nearest base
+response_errors = {
+    asyncio.TimeoutError: "Timeout Error",
+    ssl.SSLError: "SSL Error",
+    aiohttp.client_exceptions.ClientSSLError: "SSL Error",
+    aiohttp.client_exceptions.ClientConnectorError: "Error Connecting",
+    aiohttp.http_exceptions.BadHttpMessage: "HTTP Error",
+}
+
+
+def get_response_error_text(error):
+    """Get Response Error Text.
+
+    Keyword Arguments:
+    error                  -- Exception raised while requesting the site.
+
+    Return Value:
+    String describing the error, or None if the error is unknown.
+    """
+    for error_class in type(error).__mro__:
+        error_text = response_errors.get(error_class)
+        if error_text is not None:
+            return error_text
+
+    return None
 
 
 async def get_response(request_future, error_type, social_network, logger):
@@ -128,33 +185,33 @@ async def get_response(request_future, error_type, social_network, logger):
         response = await request_future
 
         status_code = response.status
-        response_content = await response.content.read()
-        charset = response.charset or 'utf-8'
-        decoded_content = response_content.decode(charset, 'ignore')
-        html_text = decoded_content
+        if response.method == 'HEAD':
+            # There is no body for HEAD requests, detection is made by status
+            # code only, so skip reading and decoding of the stream at all
+            response.release()
+            html_text = ''
+        else:
+            response_content = await response.content.read()
+            charset = response.charset or 'utf-8'
+            decoded_content = response_content.decode(charset, 'ignore')
+            html_text = decoded_content
 
         if status_code > 0:
             error_text = None
 
         logger.debug(html_text)
 
-    except asyncio.TimeoutError as errt:
-        error_text = "Timeout Error"
-        expection_text = str(errt)
-    except (ssl.SSLCertVerificationError, ssl.SSLError) as err:
-        error_text = "SSL Error"
-        expection_text = str(err)
-    except aiohttp.client_exceptions.ClientConnectorError as err:
-        error_text = "Error Connecting"
-        expection_text = str(err)
-    except aiohttp.http_exceptions.BadHttpMessage as err:
-        error_text = "HTTP Error"
-        expection_text = str(err)
     except Exception as err:
-        logger.warning(f'Unhandled error while requesting {social_network}: {err}')
-        logger.debug(err, exc_info=True)
-        error_text = "Some Error"
-        expection_text = str(err)
+        error_text = get_response_error_text(err)
+        if error_text is None:
+            logger.warning(f'Unhandled error while requesting {social_network}: {err}')
+            logger.debug(err, exc_info=True)
+            error_text = "Some Error"
+
+        # Formatting of the nested connection errors isn't cheap and the
+        # details are interesting only for verbose output
+        if logger.isEnabledFor(logging.WARNING):
+            expection_text = str(err)
 
     # TODO: return only needed information
     return html_text, status_code, error_text, expection_text
@@ -162,8 +219,9 @@ async def get_response(request_future, error_type, social_network, logger):
 
 async def sherlock(username, site_data, query_notify, logger,
              tor=False, unique_tor=False,
-             proxy=None, timeout=None, ids_search=False,
-             id_type='username',tags=[], debug=False):
+             proxy=None, timeout=None, connect_timeout=None, ids_search=False,
+             id_type='username',tags=[], debug=False, session=None,
+             max_workers=default_max_workers, site_checks=None):
     """Run Sherlock Analysis.
 
     Checks for existence of username on various social media sites.
@@ -178,9 +236,25 @@ async def sherlock(username, site_data, query_notify, logger,
     tor                    -- Boolean indicating whether to use a tor circuit for the requests.
     unique_tor             -- Boolean indicating whether to use a new tor circuit for each request.
     proxy                  -- String indicating the proxy URL
-    timeout                -- Time in seconds to wait before timing out request.
+    timeout                -- Time in seconds to wait for data from the site
+                              before timing out request.
+                              Default is no timeout.
+    connect_timeout        -- Time in seconds to wait for connection to the
+                              site before timing out request.
                               Default is no timeout.
+                              The whole request is limited by the sum of
+                              the timeouts.
     ids_search             -- Search for other usernames in website pages & recursive search by them.
+    debug                  -- Boolean indicating whether to save sites responses
+                              in debug.txt and in the results.
+    session                -- aiohttp.ClientSession to reuse between calls,
+                              see create_session(). A new one is created
+                              (and closed) for this call if not specified.
+    max_workers            -- Maximum number of simultaneous requests.
+    site_checks            -- Dictionary of SiteCheckInformation() objects
+                              by site name, to prepare the site data once
+                              for many calls.  The ones missing are
+                              prepared for this call.
 
     Return Value:
     Dictionary containing results from report. Key of dictionary is the name
@@ -192,208 +266,60 @@ async def sherlock(username, site_data, query_notify, logger,
                        account existence.
         http_status:   HTTP status code of query which checked for existence on
                        site.
-        response_text: Text that came back from request.  May be None if
-                       there was an HTTP error when checking for existence.
+        response_text: Text that came back from request.  Saved only in debug
+                       mode, None otherwise or if there was an HTTP error
+                       when checking for existence.
     """
 
     #Notify caller that we are starting the query.
     query_notify.start(username, id_type)
 
-    # Create session based on request methodology
+    # All the requests are made by the aiohttp session below, Tor is only
+    # used to reset the identity (if needed)
     if tor or unique_tor:
-        #Requests using Tor obfuscation
         underlying_request = TorRequest()
-        underlying_session = underlying_request.session
-    else:
-        #Normal requests
-        underlying_session = requests.session()
-        underlying_request = requests.Request()
-
-    #Limit number of workers to 20.
-    #This is probably vastly overkill.
-    if len(site_data) >= 20:
-        max_workers=20
-    else:
-        max_workers=len(site_data)
-
-    # TODO: connector
-    connector = aiohttp.TCPConnector(ssl=False)
-    session = aiohttp.ClientSession(connector=connector)
-
-    # Results from analysis of all sites
-    results_total = {}
-
-    # First create futures for all requests. This allows for the requests to run in parallel
-    for social_network, net_info in site_data.items():
-
-        # print(id_type) # print(social_network)
-        if net_info.get('type', 'username') != id_type:
-            continue
-
-        site_tags = set(net_info.get('tags', []))
-        if tags:
-            if not tags.intersection(site_tags):
-                continue
-
-        if 'disabled' in net_info and net_info['disabled']:
-            continue
-
-        # Results from analysis of this specific site
-        results_site = {}
-
-        # Record URL of main site
-        results_site['url_main'] = net_info.get("urlMain")
-
-        # A user agent is needed because some sites don't return the correct
-        # information since they think that we are bots (Which we actually are...)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11.1; rv:55.0) Gecko/20100101 Firefox/55.0',
-        }
-
-        if "headers" in net_info:
-            # Override/append any extra headers required by a given site.
-            headers.update(net_info["headers"])
-
-        # URL of user on site (if it exists)
-        url = net_info.get('url').format(username)
-
-        # Don't make request if username is invalid for the site
-        regex_check = net_info.get("regexCheck")
-        if regex_check and re.search(regex_check, username) is None:
-            # No need to do the check at the site: this user name is not allowed.
-            results_site['status'] = QueryResult(username,
-                                                 social_network,
-                                                 url,
-                                                 QueryStatus.ILLEGAL)
-            results_site["url_user"] = ""
-            results_site['http_status'] = ""
-            results_site['response_text'] = ""
-            query_notify.update(results_site['status'])
-        else:
-            # URL of user on site (if it exists)
-            results_site["url_user"] = url
-            url_probe = net_info.get("urlProbe")
-            if url_probe is None:
-                # Probe URL is normal one seen by people out on the web.
-                url_probe = url
-            else:
-                # There is a special URL for probing existence separate
-                # from where the user profile normally can be found.
-                url_probe = url_probe.format(username)
-
-            if (net_info["errorType"] == 'status_code' and 
-                net_info.get("request_head_only", True) == True):
-                #In most cases when we are detecting by status code,
-                #it is not necessary to get the entire body:  we can
-                #detect fine with just the HEAD response.
-                request_method = session.head
-            else:
-                #Either this detect method needs the content associated
-                #with the GET response, or this specific website will
-                #not respond properly unless we request the whole page.
-                request_method = session.get
-
-            if net_info["errorType"] == "response_url":
-                # Site forwards request to a different URL if username not
-                # found.  Disallow the redirect so we can capture the
-                # http status from the original URL request.
-                allow_redirects = False
-            else:
-                # Allow whatever redirect that the site wants to do.
-                # The final result of the request will be what is available.
-                allow_redirects = True
-
-            def parse_cookies(cookies_str):
-                cookies = SimpleCookie()
-                cookies.load(cookies_str)
-                return {key: morsel.value for key, morsel in cookies.items()}
-
-            if os.path.exists(cookies_file):
-                cookies_obj = cookielib.MozillaCookieJar(cookies_file)
-                cookies_obj.load(ignore_discard=True, ignore_expires=True)
-            else:
-                cookies_obj = []
-
-            # This future starts running the request in a new thread, doesn't block the main thread
-            if proxy is not None:
-                proxies = {"http": proxy, "https": proxy}
-                future = request_method(url=url_probe, headers=headers,
-                                        proxies=proxies,
-                                        allow_redirects=allow_redirects,
-                                        timeout=timeout,
-                                        )
-            else:
-                future = request_method(url=url_probe, headers=headers,
-                                        allow_redirects=allow_redirects,
-                                        timeout=timeout,
-                                        )
-
-            # Store future in data for access later
-            net_info["request_future"] = future
-
-            # Reset identify for tor (if needed)
-            if unique_tor:
-                underlying_request.reset_identity()
-
-        # Add this site's results into final dictionary with all of the other results.
-        results_total[social_network] = results_site
 
+    # Limit number of simultaneous requests, it makes no sense to have
+    # more workers than sites
+    max_workers = max(1, min(max_workers, len(site_data)))
+    workers_semaphore = asyncio.Semaphore(max_workers)
+
+    own_session = session is None
+    if own_session:
+        session = create_session(max_workers)
+    # Separate timeouts to fail fast on dead hosts, but let alive ones send
+    # the response slowly.  The whole request, including DNS resolution and
+    # waiting for a free connection in pool, is limited by their sum
+    request_timeouts = [t for t in (connect_timeout, timeout) if t is not None]
+    client_timeout = aiohttp.ClientTimeout(total=sum(request_timeouts) if request_timeouts else None,
+                                           sock_connect=connect_timeout,
+                                           sock_read=timeout)
 
     # TODO: move into top-level function
-    async def update_site_data_from_response(site, site_info):
-        future = site_info.get('request_future')
-        if not future:
-            # ignore: search by incompatible id type
-            return
-
-        error_type = site_info['errorType']
-        site_data[site]['resp'] = await get_response(request_future=future,
-                                             error_type=error_type,
-                                             social_network=site,
-                                             logger=logger)
-
-    tasks = []
-    for social_network, net_info in site_data.items():
-        future = asyncio.ensure_future(update_site_data_from_response(social_network, net_info))
-        tasks.append(future)
-
-    await asyncio.gather(*tasks)
-    await session.close()
-
-    # TODO: split to separate functions
-    for social_network, net_info in site_data.items():
-
-        # Retrieve results again
-        results_site = results_total.get(social_network)
-        if not results_site:
-            continue
-
-        # Retrieve other site information again
+    async def check_site_response(social_network, net_info, results_site, future):
+        async with workers_semaphore:
+            # Time of waiting for a free worker isn't counted, time of waiting
+            # for a free connection in pool is
+            start = monotonic()
+            resp = await get_response(request_future=future,
+                                      error_type=net_info.error_type,
+                                      social_network=social_network,
+                                      logger=logger)
+            response_time = monotonic() - start
+
+        # The response is processed as soon as it arrives, so a slow site
+        # doesn't delay the sites which have already answered
         url = results_site.get("url_user")
         logger.debug(url)
 
-        status = results_site.get("status")
-        if status is not None:
-            # We have already determined the user doesn't exist here
-            continue
-
         # Get the expected error type
-        error_type = net_info["errorType"]
+        error_type = net_info.error_type
 
         # Get the failure messages and comments
-        failure_errors = net_info.get("errors", {})
-
-        # TODO: refactor
-        resp = net_info.get('resp')
-        if not resp:
-            logger.error(f'No response for {social_network}')
-            continue
+        failure_errors = net_info.errors
 
         html_text, status_code, error_text, expection_text = resp
 
-        # TODO: add elapsed request time counting
-        response_time = None
-
         if debug:
             with open('debug.txt', 'a') as f:
                 status = status_code or 'No response'
@@ -401,11 +327,16 @@ async def sherlock(username, site_data, query_notify, logger,
                 if html_text:
                     f.write(f'code: {status}\nresponse: {str(html_text)}\n')
 
+        # Find all the site errors and absence messages in one pass
+        found_flags = set()
+        if html_text:
+            found_flags = net_info.flags_matcher.find(html_text)
+
         # TODO: move info separate module
-        def detect_error_page(html_text, status_code, fail_flags, ignore_403):
+        def detect_error_page(html_text, status_code, fail_flags, found_flags, ignore_403):
             # Detect service restrictions such as a country restriction
             for flag, msg in fail_flags.items():
-                if flag in html_text:
+                if flag in found_flags:
                     return 'Some site error', msg
 
             # Detect common restrictions such as provider censorship and bot protection 
@@ -422,7 +353,8 @@ async def sherlock(username, site_data, query_notify, logger,
             return None, None
 
         if status_code and not error_text:
-            error_text, site_error_text = detect_error_page(html_text, status_code, failure_errors, 'ignore_403' in net_info)
+            error_text, site_error_text = detect_error_page(html_text, status_code, failure_errors, found_flags,
+                                                            net_info.ignore_403)
 
         if error_text is not None:
             result = QueryResult(username,
@@ -432,55 +364,25 @@ async def sherlock(username, site_data, query_notify, logger,
                                  query_time=response_time,
                                  context=error_text)
         elif error_type == "message":
-            absence_flags = net_info.get("errorMsg")
-            is_absence_flags_list = isinstance(absence_flags, list)
-            absence_flags_set = set(absence_flags) if is_absence_flags_list else set({absence_flags})
             # Checks if the error message is in the HTML
-            is_absence_detected = any([(absence_flag in html_text) for absence_flag in absence_flags_set])
-            if not is_absence_detected:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.CLAIMED,
-                                     query_time=response_time)
-            else:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.AVAILABLE,
-                                     query_time=response_time)
+            is_absence_detected = not net_info.error_msg.isdisjoint(found_flags)
+            result = claim_or_available(not is_absence_detected,
+                                        username, social_network, url,
+                                        query_time=response_time)
         elif error_type == "status_code":
             # Checks if the status code of the response is 2XX
-            if not status_code >= 300 or status_code < 200:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.CLAIMED,
-                                     query_time=response_time)
-            else:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.AVAILABLE,
-                                     query_time=response_time)
+            result = claim_or_available(status_code_is_success(status_code),
+                                        username, social_network, url,
+                                        query_time=response_time)
         elif error_type == "response_url":
             # For this detection method, we have turned off the redirect.
             # So, there is no need to check the response URL: it will always
             # match the request.  Instead, we will ensure that the response
             # code indicates that the request was successful (i.e. no 404, or
             # forward to some odd redirect).
-            if 200 <= status_code < 300:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.CLAIMED,
-                                     query_time=response_time)
-            else:
-                result = QueryResult(username,
-                                     social_network,
-                                     url,
-                                     QueryStatus.AVAILABLE,
-                                     query_time=response_time)
+            result = claim_or_available(status_code_is_success(status_code),
+                                        username, social_network, url,
+                                        query_time=response_time)
         else:
             #It should be impossible to ever get here...
             raise ValueError(f"Unknown Error Type '{error_type}' for "
@@ -488,9 +390,16 @@ async def sherlock(username, site_data, query_notify, logger,
 
         extracted_ids_data = ''
 
-        if ids_search and result.status == QueryStatus.CLAIMED:
+        # Only successfully loaded pages can contain ids of the account
+        if (ids_search and result.status == QueryStatus.CLAIMED and html_text
+                and status_code_is_success(status_code)):
             try:
-                extracted_ids_data = extract(html_text)
+                if len(html_text) < extract_inline_max_size:
+                    extracted_ids_data = extract(html_text)
+                else:
+                    loop = asyncio.get_running_loop()
+                    extracted_ids_data = await loop.run_in_executor(extract_executor,
+                                                                    extract, html_text)
             except Exception as e:
                 logger.warning(f'Error while parsing {social_network}: {e}', exc_info=True)
 
@@ -513,11 +422,138 @@ async def sherlock(username, site_data, query_notify, logger,
 
         # Save results from request
         results_site['http_status'] = status_code
-        results_site['response_text'] = html_text
+        # Pages are big and aren't used after the check, keep them only
+        # for debugging to not hold all of them in memory until the end
+        results_site['response_text'] = html_text if debug else None
+
+    # Results from analysis of all sites
+    results_total = {}
+
+    # Requests of all sites, each one processes its own response
+    tasks = []
+    tasks_sites = []
+
+    # First create futures for all requests. This allows for the requests to run in parallel
+    for social_network, site_information in site_data.items():
+        net_info = site_checks.get(social_network) if site_checks else None
+        if net_info is None:
+            # Site data was not loaded by SitesInformation
+            net_info = SiteCheckInformation(site_information)
+
+        # print(id_type) # print(social_network)
+        if net_info.type != id_type:
+            continue
+
+        if tags and tags.isdisjoint(net_info.tags):
+            continue
+
+        if net_info.disabled:
+            continue
+
+        # Results from analysis of this specific site
+        results_site = {}
+
+        # Record URL of main site
+        results_site['url_main'] = net_info.url_main
+
+        # Default headers merged with the site ones, see SiteCheckInformation()
+        headers = net_info.headers
+
+        # URL of user on site (if it exists)
+        url = net_info.url_fmt % (username,)
+
+        # Don't make request if username is invalid for the site
+        regex_check = net_info.regex_check
+        if regex_check and regex_check.search(username) is None:
+            # No need to do the check at the site: this user name is not allowed.
+            results_site['status'] = QueryResult(username,
+                                                 social_network,
+                                                 url,
+                                                 QueryStatus.ILLEGAL)
+            results_site["url_user"] = ""
+            results_site['http_status'] = ""
+            results_site['response_text'] = ""
+            query_notify.update(results_site['status'])
+        else:
+            # URL of user on site (if it exists)
+            results_site["url_user"] = url
+            url_probe = net_info.url_probe_fmt
+            if url_probe is None:
+                # Probe URL is normal one seen by people out on the web.
+                url_probe = url
+            else:
+                # There is a special URL for probing existence separate
+                # from where the user profile normally can be found.
+                url_probe = url_probe % (username,)
+
+            if (net_info.error_type == 'status_code' and
+                net_info.request_head_only == True):
+                #In most cases when we are detecting by status code,
+                #it is not necessary to get the entire body:  we can
+                #detect fine with just the HEAD response.
+                request_method = session.head
+            else:
+                #Either this detect method needs the content associated
+                #with the GET response, or this specific website will
+                #not respond properly unless we request the whole page.
+                request_method = session.get
+
+            if net_info.error_type == "response_url":
+                # Site forwards request to a different URL if username not
+                # found.  Disallow the redirect so we can capture the
+                # http status from the original URL request.
+                allow_redirects = False
+            else:
+                # Allow whatever redirect that the site wants to do.
+                # The final result of the request will be what is available.
+                allow_redirects = True
+
+            # This coroutine is only scheduled here, all the requests run concurrently below
+            if proxy is not None:
+                future = request_method(url=url_probe, headers=headers,
+                                        proxy=proxy,
+                                        allow_redirects=allow_redirects,
+                                        timeout=client_timeout,
+                                        )
+            else:
+                future = request_method(url=url_probe, headers=headers,
+                                        allow_redirects=allow_redirects,
+                                        timeout=client_timeout,
+                                        )
+
+            tasks.append(asyncio.create_task(
+                check_site_response(social_network, net_info, results_site, future)))
+            tasks_sites.append((social_network, results_site))
+
+            # Reset identify for tor (if needed)
+            if unique_tor:
+                underlying_request.reset_identity()
 
         # Add this site's results into final dictionary with all of the other results.
         results_total[social_network] = results_site
 
+    # Wait for all the requests, results are processed as they are completed.
+    # An error while checking a single site doesn't stop the search on others
+    tasks_results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for (social_network, results_site), error in zip(tasks_sites, tasks_results):
+        if not isinstance(error, Exception):
+            continue
+
+        logger.error(f'Error while checking {social_network}: {error}', exc_info=error)
+        if 'status' not in results_site:
+            results_site['status'] = QueryResult(username,
+                                                 social_network,
+                                                 results_site.get('url_user'),
+                                                 QueryStatus.UNKNOWN,
+                                                 context='Some Error')
+            results_site['http_status'] = 0
+            results_site['response_text'] = None
+            query_notify.update(results_site['status'])
+
+    if own_session:
+        await session.close()
+
     #Notify caller that all queries are finished.
     query_notify.finish()
 
@@ -549,7 +585,36 @@ def timeout_check(value):
     return timeout
 
 
-async def main():
+def positive_int_check(value):
+    """Check Positive Integer Argument.
+
+    Checks number of workers or connections for validity.
+
+    Keyword Arguments:
+    value                  -- String containing the number.
+
+    Return Value:
+    Positive integer number.
+
+    NOTE:  Will raise an exception if the number is invalid.
+    """
+    from argparse import ArgumentTypeError
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"Number '{value}' must be an integer.")
+    if number <= 0:
+        raise ArgumentTypeError(f"Number '{value}' must be greater than 0.")
+    return number
+
+
+def setup_arguments_parser():
+    """Setup Arguments Parser.
+
+    Return Value:
+    ArgumentParser object for the command line arguments of the module.
+    """
     version_string = f"%(prog)s {__version__}\n" +  \
                      f"{requests.__description__}:  {requests.__version__}\n" + \
                      f"Python:  {platform.python_version()}"
@@ -600,14 +665,38 @@ async def main():
     parser.add_argument("--json", "-j", metavar="JSON_FILE",
                         dest="json_file", default=None,
                         help="Load data from a JSON file or an online, valid, JSON file.")
-    parser.add_argument("--timeout",
+    parser.add_argument("--timeout", "--read-timeout",
                         action="store", metavar='TIMEOUT',
                         dest="timeout", type=timeout_check, default=10,
-                        help="Time (in seconds) to wait for response to requests."
-                             "Default timeout of 10.0s."
-                             "A longer timeout will be more likely to get results from slow sites."
+                        help="Time (in seconds) to wait for response to requests. "
+                             "Default timeout of 10.0s. "
+                             "The whole request is limited by the sum of this and connection timeouts. "
+                             "A longer timeout will be more likely to get results from slow sites. "
                              "On the other hand, this may cause a long delay to gather all results."
                         )
+    parser.add_argument("--connect-timeout",
+                        action="store", metavar='CONNECT_TIMEOUT',
+                        dest="connect_timeout", type=timeout_check, default=5,
+                        help="Time (in seconds) to wait for connection to sites. "
+                             "Default timeout of 5.0s. "
+                             "Unreachable sites are skipped faster with a shorter timeout."
+                        )
+    parser.add_argument("--workers", "-w",
+                        action="store", metavar='WORKERS',
+                        dest="max_workers", type=positive_int_check, default=default_max_workers,
+                        help="Maximum number of simultaneous requests. "
+                             f"Default is {default_max_workers}. "
+                             "More workers make the whole search faster, but too many "
+                             "of them can increase the time of every single response "
+                             "and the number of timeouts on slow networks."
+                        )
+    parser.add_argument("--pool-size",
+                        action="store", metavar='POOL_SIZE',
+                        dest="pool_size", type=positive_int_check, default=None,
+                        help="Maximum number of simultaneously open connections, "
+                             "reused between sites and usernames. "
+                             "Default is the number of workers."
+                        )
     parser.add_argument("--print-found",
                         action="store_true", dest="print_found_only", default=False,
                         help="Do not output sites where the username was not found."
@@ -628,6 +717,17 @@ async def main():
                         action="store_true", dest="ids_search", default=False,
                         help="Make scan of pages for other usernames and recursive search by them."
                         )
+    parser.add_argument("--cache",
+                        action="store_true", dest="use_cache", default=False,
+                        help="Reuse results of the searches made during the last hour "
+                             "for the same username and sites instead of requesting sites again."
+                        )
+    parser.add_argument("--resume",
+                        action="store_true", dest="resume", default=False,
+                        help="Continue the searches of the last day, usernames checked by them "
+                             "with the same sites and options are not requested again "
+                             "and their saved results are used."
+                        )
     parser.add_argument("--parse",
                         dest="parse_url", default='',
                         help="Parse page by URL and extract username and IDs to use for search."
@@ -641,7 +741,79 @@ async def main():
                         dest="tags", default='',
                         help="Specify tags of sites."
                         )
-    args = parser.parse_args()
+    return parser
+
+
+@lru_cache(maxsize=4)
+def load_sites(json_file=None):
+    """Load Sites Information.
+
+    Loaded data is memoized, so repeated searches in the same process don't
+    read and parse the sites data file again.
+
+    Keyword Arguments:
+    json_file              -- String which indicates path to data file,
+                              see SitesInformation().
+
+    Return Value:
+    SitesInformation() object.
+    """
+    return SitesInformation(json_file)
+
+
+arguments_parser = setup_arguments_parser()
+
+
+def csv_rows(username, results):
+    """Get CSV Report Rows.
+
+    Keyword Arguments:
+    username               -- String indicating username that was searched.
+    results                -- Dictionary containing results of sherlock().
+
+    Return Value:
+    Generator of tuples with the row values in csv_header order, one row
+    for each site.
+    """
+    for site, results_site in results.items():
+        status = results_site['status']
+        yield (username,
+               site,
+               results_site['url_main'],
+               results_site['url_user'],
+               str(status.status),
+               results_site['http_status'],
+               '' if status.query_time is None else status.query_time,
+               )
+
+
+def filter_sites(site_data, site_list):
+    """Filter Sites.
+
+    Keyword Arguments:
+    site_data              -- Dictionary containing information about web
+                              sites by site name.
+    site_list              -- List of strings containing names of desired
+                              sites, case-insensitive.
+
+    Return Value:
+    Tuple of the dictionary containing information about the desired sites
+    only and the list of desired site names which are not found.
+    """
+    # Site names are case-insensitive, so compare them in lower case.
+    requested_sites = {site.lower() for site in site_list}
+    filtered_site_data = {name: information for name, information in site_data.items()
+                          if name.lower() in requested_sites}
+
+    # Build up list of sites not supported for future error message.
+    found_sites = {name.lower() for name in filtered_site_data}
+    site_missing = [site for site in site_list if site.lower() not in found_sites]
+
+    return filtered_site_data, site_missing
+
+
+async def main():
+    args = arguments_parser.parse_args()
 
     # Logging    
     log_level = logging.ERROR
@@ -660,7 +832,7 @@ async def main():
     logger.setLevel(log_level)
 
     # Usernames initial list
-    usernames = {
+    initial_usernames = {
         u: 'username'
         for u in args.username
         if u not in ('-')
@@ -695,16 +867,16 @@ async def main():
         print(text)
         for k, v in info.items():
             if 'username' in k:
-                usernames[v] = 'username'
+                initial_usernames[v] = 'username'
             if k in supported_recursive_search_ids:
-                usernames[v] = k
+                initial_usernames[v] = k
 
     if args.tags:
         args.tags = set(args.tags.split(','))
 
     #Create object with all information about sites we are aware of.
     try:
-        sites = SitesInformation(args.json_file)
+        sites = load_sites(args.json_file)
     except Exception as error:
         print(f"ERROR:  {error}")
         sys.exit(1)
@@ -712,9 +884,8 @@ async def main():
     #Create original dictionary from SitesInformation() object.
     #Eventually, the rest of the code will be updated to use the new object
     #directly, but this will glue the two pieces together.
-    site_data_all = {}
-    for site in sites:
-        site_data_all[site.name] = site.information
+    site_data_all = {site.name: site.information for site in sites}
+    site_checks = {site.name: site.check for site in sites}
 
     if args.site_list is None:
         # Not desired to look at a sub-set of sites
@@ -723,29 +894,22 @@ async def main():
         # User desires to selectively run queries on a sub-set of the site list.
 
         # Make sure that the sites are supported & build up pruned site database.
-        site_data = {}
-        site_missing = []
-        for site in args.site_list:
-            for existing_site in site_data_all:
-                if site.lower() == existing_site.lower():
-                    site_data[existing_site] = site_data_all[existing_site]
-            if not site_data:
-                # Build up list of sites not supported for future error message.
-                site_missing.append(f"'{site}'")
+        site_data, site_missing = filter_sites(site_data_all, args.site_list)
 
         if site_missing:
-            print(
-                f"Error: Desired sites not found: {', '.join(site_missing)}.")
+            site_missing_str = ', '.join(f"'{site}'" for site in site_missing)
+            print(f"Error: Desired sites not found: {site_missing_str}.")
             sys.exit(1)
 
     if args.rank:
-        # Sort data by rank
-        site_dataCpy = dict(site_data)
-        ranked_sites = sorted(site_data, key=lambda k: ("rank" not in k, site_data[k].get("rank", sys.maxsize)))
-        site_data = {}
-        for site in ranked_sites:
-            site_data[site] = site_dataCpy.get(site)
+        # Sort data by rank, sites without rank go to bottom of list
+        rank_keys = {site: information.get("rank", sys.maxsize)
+                     for site, information in site_data.items()}
+        site_data = {site: site_data[site]
+                     for site in sorted(site_data, key=rank_keys.__getitem__)}
 
+    # Group sites once, every username is checked only on sites of its type
+    site_data_by_type = group_sites_by_type(site_data)
 
     #Create notify object for query results.
     query_notify = QueryNotifyPrint(result=None,
@@ -754,89 +918,198 @@ async def main():
                                     skip_check_errors=args.skip_check_errors,
                                     color=not args.no_color)
 
+    # Lower case forms of the usernames ever queued, so a username found
+    # several times by ids search (e.g. on different sites or by different
+    # usernames of the same wave) is searched only once
     already_checked = set()
 
-    while usernames:
-        username, id_type = list(usernames.items())[0]
-        del usernames[username]
-
-        if username.lower() in already_checked:
-            continue
+    # Queue of usernames to search with their types
+    usernames = deque()
+
+    def queue_username(username, id_type):
+        lc_username = username.lower()
+        if lc_username not in already_checked:
+            already_checked.add(lc_username)
+            usernames.append((username, id_type))
+
+    for username, id_type in initial_usernames.items():
+        queue_username(username, id_type)
+
+    # Limits simultaneous searches of different usernames
+    usernames_semaphore = asyncio.Semaphore(default_usernames_workers)
+
+    # Saved results are valid only for the same set of sites
+    sites_hash = sites_fingerprint(site_data, args.tags)
+
+    async def search_sites(username, id_type, site_data_search, notify):
+        async with usernames_semaphore:
+            return await sherlock(username,
+                                  site_data_search,
+                                  notify,
+                                  tor=args.tor,
+                                  unique_tor=args.unique_tor,
+                                  proxy=args.proxy,
+                                  timeout=args.timeout,
+                                  connect_timeout=args.connect_timeout,
+                                  ids_search=args.ids_search,
+                                  id_type=id_type,
+                                  tags=args.tags,
+                                  debug=args.verbose,
+                                  logger=logger,
+                                  session=session,
+                                  max_workers=args.max_workers,
+                                  site_checks=site_checks)
+
+    async def search_username(username, id_type, notify):
+        site_data_search = site_data_by_type.get(id_type, {})
+
+        # Results are taken from the first store which has them saved, and
+        # saved to the stores which miss them
+        saved_results = None
+        missing_stores = []
+        if results_stores:
+            key = results_stores[0].key(username, id_type, sites_hash, args.ids_search)
+            for results_store in results_stores:
+                saved_results = results_store.get(key)
+                if saved_results is not None:
+                    break
+                missing_stores.append(results_store)
+
+        if saved_results is None:
+            results = await search_sites(username, id_type, site_data_search, notify)
         else:
-            already_checked.add(username.lower())
+            # Sites which failed to answer are requested again, the saved
+            # results of the others are shown the same way as the new ones
+            unknown_site_data = {site: site_data_search[site]
+                                 for site, results_site in saved_results.items()
+                                 if results_site['status'].status == QueryStatus.UNKNOWN
+                                 and site in site_data_search}
+
+            notify.start(username, id_type)
+            for site, results_site in saved_results.items():
+                if site not in unknown_site_data:
+                    notify.update(results_site['status'])
+
+            results = saved_results
+            if unknown_site_data:
+                results.update(await search_sites(username, id_type, unknown_site_data,
+                                                  QueryNotifyUpdates(notify)))
+                missing_stores = results_stores
+
+            notify.finish()
+
+        for results_store in missing_stores:
+            results_store.set(key, results)
+
+        return username, results, notify
+
+    if args.folderoutput and not args.output:
+        # The usernames results should be stored in a targeted folder.
+        # If the folder doesn't exist, create it first
+        os.makedirs(args.folderoutput, exist_ok=True)
+
+    # Reports of the usernames written to the single output file, the
+    # usernames found by ids search are added to it instead of overwriting
+    output_reports = []
+
+    # Status of the found accounts, compared with every site result
+    claimed_status = QueryStatus.CLAIMED
+
+    # Everything opened for the search is closed even if it is interrupted
+    session = None
+    results_stores = []
+    output_file = None
+    try:
+        session = create_session(args.pool_size or args.max_workers)
+
+        # Searches made by the previous runs with the same parameters are not
+        # requested again: during the last hour with --cache, during the last
+        # day with --resume
+        if args.use_cache:
+            results_stores.append(ResultsCache())
+        if args.resume:
+            results_stores.append(ResultsCache(default_state_path,
+                                               ttl=default_state_ttl,
+                                               commit_batch=default_state_commit_batch))
 
-        # check for characters do not supported by sites generally
-        found_unsupported_chars = set(unsupported_characters).intersection(set(username))
+        if args.output:
+            output_file = open(args.output, "w", encoding="utf-8")
 
-        if found_unsupported_chars:
-            pretty_chars_str = ','.join(map(lambda s: f'"{s}"', found_unsupported_chars))
-            print(f'Found unsupported URL characters: {pretty_chars_str}, skip search by username "{username}"')
-            continue
+        # Usernames are searched in waves: all the known usernames are checked
+        # simultaneously, the new ones found by them make the next wave
+        while usernames:
+            usernames_wave = []
+            while usernames:
+                username, id_type = usernames.popleft()
 
-        results = await sherlock(username,
-                           site_data,
-                           query_notify,
-                           tor=args.tor,
-                           unique_tor=args.unique_tor,
-                           proxy=args.proxy,
-                           timeout=args.timeout,
-                           ids_search=args.ids_search,
-                           id_type=id_type,
-                           tags=args.tags,
-                           debug=args.verbose,
-                           logger=logger)
+                # check for characters do not supported by sites generally
+                found_unsupported_chars = set(unsupported_characters).intersection(set(username))
 
+                if found_unsupported_chars:
+                    pretty_chars_str = ','.join(map(lambda s: f'"{s}"', found_unsupported_chars))
+                    print(f'Found unsupported URL characters: {pretty_chars_str}, skip search by username "{username}"')
+                    continue
 
-        if args.output:
-            result_file = args.output
-        elif args.folderoutput:
-            # The usernames results should be stored in a targeted folder.
-            # If the folder doesn't exist, create it first
-            os.makedirs(args.folderoutput, exist_ok=True)
-            result_file = os.path.join(args.folderoutput, f"{username}.txt")
-        else:
-            result_file = f"{username}.txt"
-
-        with open(result_file, "w", encoding="utf-8") as file:
-            exists_counter = 0
-            for website_name in results:
-                dictionary = results[website_name]
-
-                new_usernames = dictionary.get('ids_usernames')
-                if new_usernames:
-                    for u, utype in new_usernames.items():
-                        usernames[u] = utype
-
-                if dictionary.get("status").status == QueryStatus.CLAIMED:
-                    exists_counter += 1
-                    file.write(dictionary["url_user"] + "\n")
-            file.write(f"Total Websites Username Detected On : {exists_counter}")
-
-        if args.csv:
-            with open(username + ".csv", "w", newline='', encoding="utf-8") as csv_report:
-                writer = csv.writer(csv_report)
-                writer.writerow(['username',
-                                 'name',
-                                 'url_main',
-                                 'url_user',
-                                 'exists',
-                                 'http_status',
-                                 'response_time_s'
-                                 ]
-                                )
-                for site in results:
-                    response_time_s = results[site]['status'].query_time
-                    if response_time_s is None:
-                        response_time_s = ""
-                    writer.writerow([username,
-                                     site,
-                                     results[site]['url_main'],
-                                     results[site]['url_user'],
-                                     str(results[site]['status'].status),
-                                     results[site]['http_status'],
-                                     response_time_s
-                                     ]
-                                    )
+                usernames_wave.append((username, id_type))
+
+            # Results of a single search are printed as they come, results of
+            # simultaneous ones are printed by username to not mix them
+            if len(usernames_wave) == 1:
+                searches = [search_username(*usernames_wave[0], query_notify)]
+            else:
+                searches = [search_username(username, id_type, QueryNotifyDeferred(query_notify))
+                            for username, id_type in usernames_wave]
+
+            for search in asyncio.as_completed(searches):
+                username, results, notify = await search
+                if isinstance(notify, QueryNotifyDeferred):
+                    notify.flush()
+
+                new_usernames = [(u, utype) for dictionary in results.values()
+                                 for u, utype in dictionary.get('ids_usernames', {}).items()]
+                for u, utype in new_usernames:
+                    queue_username(u, utype)
+
+                claimed_urls = [dictionary["url_user"] for dictionary in results.values()
+                                if dictionary["status"].status == claimed_status]
+                total_text = f"Total Websites Username Detected On : {len(claimed_urls)}"
+
+                if output_file is not None:
+                    # All the usernames found by the search share the output
+                    output_reports.append((username, claimed_urls, total_text))
+                else:
+                    if args.folderoutput:
+                        result_file = os.path.join(args.folderoutput, f"{username}.txt")
+                    else:
+                        result_file = f"{username}.txt"
+
+                    # The whole report is written at once, with a single syscall
+                    with open(result_file, "w", encoding="utf-8") as file:
+                        file.write("\n".join([*claimed_urls, total_text]))
+
+                if args.csv:
+                    with open(username + ".csv", "w", newline='', encoding="utf-8",
+                              buffering=csv_buffer_size) as csv_report:
+                        writer = csv.writer(csv_report)
+                        writer.writerow(csv_header)
+                        writer.writerows(csv_rows(username, results))
+    finally:
+        # Saved results are kept even if the search is interrupted
+        for results_store in results_stores:
+            results_store.close()
+
+        if session is not None:
+            await session.close()
+
+        if output_file is not None:
+            # Usernames are marked only if there are several of them
+            if len(output_reports) == 1:
+                _, claimed_urls, total_text = output_reports[0]
+                output_file.write("\n".join([*claimed_urls, total_text]))
+            else:
+                output_file.writelines("\n".join([f"Username: {username}", *claimed_urls, total_text]) + "\n"
+                                       for username, claimed_urls, total_text in output_reports)
+            output_file.close()
 
 
 if __name__ == "__main__":
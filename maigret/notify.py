@@ -105,6 +105,151 @@ class QueryNotify():
         return result
 
 
+class QueryNotifyDeferred(QueryNotify):
+    """Query Notify Deferred Object.
+
+    Query notify class that saves notifications and passes them to another
+    query notify object later, so the results of simultaneous queries about
+    different usernames are not mixed.
+    """
+    def __init__(self, query_notify):
+        """Create Query Notify Deferred Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        query_notify           -- Object with base type of QueryNotify(),
+                                  which will get the saved notifications.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__()
+        self.query_notify = query_notify
+        self.notifications = []
+
+        return
+
+    def start(self, message=None, id_type='username'):
+        """Notify Start.
+
+        Saves notification for start of query.
+
+        Keyword Arguments:
+        self                   -- This object.
+        message                -- Object that is used to give context to start
+                                  of query.
+                                  Default is None.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.notifications.append((self.query_notify.start, (message, id_type)))
+
+        return
+
+    def update(self, result):
+        """Notify Update.
+
+        Saves notification for query result.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.result = result
+        self.notifications.append((self.query_notify.update, (result,)))
+
+        return
+
+    def finish(self, message=None):
+        """Notify Finish.
+
+        Saves notification for finish of query.
+
+        Keyword Arguments:
+        self                   -- This object.
+        message                -- Object that is used to give context to finish
+                                  of query.
+                                  Default is None.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.notifications.append((self.query_notify.finish, (message,)))
+
+        return
+
+    def flush(self):
+        """Flush Notifications.
+
+        Passes all the saved notifications to the query notify object.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        for notify_method, args in self.notifications:
+            notify_method(*args)
+        self.notifications = []
+
+        return
+
+
+class QueryNotifyUpdates(QueryNotify):
+    """Query Notify Updates Object.
+
+    Query notify class that passes only the query results to another query
+    notify object, so the results of additional queries are notified about
+    along with the ones already started.
+    """
+    def __init__(self, query_notify):
+        """Create Query Notify Updates Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        query_notify           -- Object with base type of QueryNotify(),
+                                  which will get the query results.
+
+        Return Value:
+        Nothing.
+        """
+
+        super().__init__()
+        self.query_notify = query_notify
+
+        return
+
+    def update(self, result):
+        """Notify Update.
+
+        Passes query result to the query notify object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        result                 -- Object of type QueryResult() containing
+                                  results for this query.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.result = result
+        self.query_notify.update(result)
+
+        return
+
+
 class QueryNotifyPrint(QueryNotify):
     """Query Notify Print Object.
 
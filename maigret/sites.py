@@ -6,9 +6,222 @@ This is the raw data that will be used to search for usernames.
 import os
 import json
 import operator
+import re
 import requests
 import sys
 
+# A user agent is needed because some sites don't return the correct
+# information since they think that we are bots (Which we actually are...)
+base_headers = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 11.1; rv:55.0) Gecko/20100101 Firefox/55.0',
+}
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # Optional dependency, parses the big sites data file much faster
+    json_loads = json.loads
+
+try:
+    import ahocorasick
+except ImportError:
+    # Optional dependency, regular expression search is used without it
+    ahocorasick = None
+
+try:
+    import re2
+except ImportError:
+    # Optional dependency, DFA-based and faster than the standard module
+    re2 = None
+
+# Single regular expression pass is faster than substring search for each
+# flag only for several flags
+flags_regex_min_count = 3
+
+
+class TextFlagsMatcher():
+    def __init__(self, flags):
+        """Create Text Flags Matcher Object.
+
+        Finds which of the known strings (flags) are present in a page text.
+        With pyahocorasick installed all the flags are found in a single
+        pass over the text.  Otherwise the text is checked for any of the
+        flags with a single regular expression (re2 if installed) and only
+        texts with some flags are searched for each flag.
+
+        Keyword Arguments:
+        self                   -- This object.
+        flags                  -- Iterable of strings to search for.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.flags = tuple(dict.fromkeys(flags))
+        self.automaton = None
+        self.regex = None
+
+        #Empty flag is found in any text, but can't be searched for.
+        if not self.flags or not all(self.flags):
+            return
+
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for flag in self.flags:
+                self.automaton.add_word(flag, flag)
+            self.automaton.make_automaton()
+        elif len(self.flags) >= flags_regex_min_count:
+            pattern = "|".join(re.escape(flag) for flag in self.flags)
+            self.regex = re.compile(pattern)
+            if re2 is not None:
+                try:
+                    self.regex = re2.compile(pattern)
+                except Exception:
+                    #Keep the standard module expression.
+                    pass
+
+        return
+
+    def find(self, text):
+        """Find Flags.
+
+        Keyword Arguments:
+        self                   -- This object.
+        text                   -- String to search flags in.
+
+        Return Value:
+        Set of strings containing flags found in the text.
+        """
+
+        if self.automaton is not None:
+            return {flag for _, flag in self.automaton.iter(text)}
+
+        #Matches of alternatives can overlap, so expression is used only
+        #to skip texts without any flags.
+        if self.regex is not None and self.regex.search(text) is None:
+            return set()
+
+        return {flag for flag in self.flags if flag in text}
+
+
+def site_text_flags(information):
+    """Get Site Text Flags.
+
+    Keyword Arguments:
+    information            -- Dictionary containing all known information
+                              about web site.
+
+    Return Value:
+    List of strings which are searched in the site pages: failure errors
+    and messages of username absence.
+    """
+
+    absence_flags = information.get("errorMsg") or []
+    if not isinstance(absence_flags, list):
+        absence_flags = [absence_flags]
+
+    return list(information.get("errors", {})) + absence_flags
+
+
+def url_template(url):
+    """Get URL Template.
+
+    Keyword Arguments:
+    url                    -- String containing URL format with the token
+                              "{}" where the username should be substituted.
+
+    Return Value:
+    String containing the same URL for "%" formatting, which is cheaper
+    than str.format() for every username.
+    """
+
+    return url.replace("%", "%%").replace("{}", "%s")
+
+
+class SiteCheckInformation():
+    """Site Check Information Object.
+
+    Everything used by every search on the site, computed once from the
+    site information.  Attributes are read for each site and each username,
+    so it is a slotted object instead of the dictionary lookups.
+    """
+    __slots__ = ("type", "tags", "disabled", "url_main", "url_fmt",
+                 "url_probe_fmt", "error_type", "error_msg", "errors",
+                 "headers", "request_head_only", "regex_check", "ignore_403",
+                 "flags_matcher")
+
+    def __init__(self, information):
+        """Create Site Check Information Object.
+
+        Keyword Arguments:
+        self                   -- This object.
+        information            -- Dictionary containing all known information
+                                  about web site.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.type              = information.get("type", "username")
+        self.tags              = frozenset(information.get("tags", []))
+        self.disabled          = bool(information.get("disabled"))
+        self.url_main          = information.get("urlMain")
+        self.error_type        = information["errorType"]
+        self.errors            = information.get("errors", {})
+        self.request_head_only = information.get("request_head_only", True)
+        self.ignore_403        = "ignore_403" in information
+
+        self.url_fmt = url_template(information["url"])
+        if information.get("urlProbe") is not None:
+            self.url_probe_fmt = url_template(information["urlProbe"])
+        else:
+            self.url_probe_fmt = None
+
+        absence_flags = information.get("errorMsg")
+        if not isinstance(absence_flags, list):
+            absence_flags = [absence_flags]
+        self.error_msg = frozenset(absence_flags)
+
+        if "headers" in information:
+            # Override/append any extra headers required by a given site.
+            self.headers = {**base_headers, **information["headers"]}
+        else:
+            self.headers = base_headers
+
+        #Compile username check once instead of every search.
+        if information.get("regexCheck"):
+            self.regex_check = re.compile(information["regexCheck"])
+        else:
+            self.regex_check = None
+
+        #Prepare search of site error and absence messages.
+        self.flags_matcher = TextFlagsMatcher(site_text_flags(information))
+
+        return
+
+
+def group_sites_by_type(site_data):
+    """Group Sites By Type.
+
+    Keyword Arguments:
+    site_data              -- Dictionary containing information about web
+                              sites by site name.
+
+    Return Value:
+    Dictionary with type of identifier used by sites ("username" by default)
+    as key and dictionary of enabled sites of that type, in the original
+    order, as value.
+    """
+
+    sites_by_type = {}
+    for site_name, information in site_data.items():
+        if information.get("disabled"):
+            continue
+        id_type = information.get("type", "username")
+        sites_by_type.setdefault(id_type, {})[site_name] = information
+
+    return sites_by_type
+
 
 class SiteInformation():
     def __init__(self, name, url_home, url_username_format, popularity_rank,
@@ -67,6 +280,9 @@ class SiteInformation():
         self.username_unclaimed  = username_unclaimed
         self.information         = information
 
+        #Prepared once for all the searches on the site.
+        self.check               = SiteCheckInformation(information)
+
         return
 
     def __str__(self):
@@ -143,7 +359,7 @@ class SitesInformation():
                                        )
             if response.status_code == 200:
                 try:
-                    site_data = response.json()
+                    site_data = json_loads(response.content)
                 except Exception as error:
                     raise ValueError(f"Problem parsing json contents at "
                                      f"'{data_file_path}':  {str(error)}."
@@ -155,9 +371,9 @@ class SitesInformation():
         else:
             #Reference is to a file.
             try:
-                with open(data_file_path, "r", encoding="utf-8") as file:
+                with open(data_file_path, "rb") as file:
                     try:
-                        site_data = json.load(file)
+                        site_data = json_loads(file.read())
                     except Exception as error:
                         raise ValueError(f"Problem parsing json contents at "
                                          f"'{data_file_path}':  {str(error)}."
@@ -3,9 +3,823 @@
 This module contains various tests.
 """
 from tests.base import SherlockBaseTest
+from result import QueryResult, QueryStatus
+from notify import QueryNotify, QueryNotifyDeferred, QueryNotifyPrint
+from unittest import mock
+import aiohttp
+import asyncio
+import cache
+import json
+import logging
+import maigret
+import os
+import sites
+import ssl
+import sys
+import tempfile
+import time
 import unittest
 
 
+class SherlockFakeSession():
+    """Sherlock Fake Session Object.
+
+    Stands for aiohttp.ClientSession, the requests are never sent and their
+    responses are given by the stubbed get_response().
+    """
+    def get(self, url, **kwargs):
+        return url
+
+    def head(self, url, **kwargs):
+        return url
+
+
+class SherlockDetectLogicTests(unittest.TestCase):
+    def sherlock_responses(self, site_data, responses):
+        """Run Sherlock With Stubbed Responses.
+
+        Keyword Arguments:
+        self                   -- This object.
+        site_data              -- Dictionary containing all of the site data.
+        responses              -- Dictionary with site name as key and tuple
+                                  of page text and status code as value.
+
+        Return Value:
+        Dictionary containing results of sherlock().
+        """
+
+        async def get_response(request_future, error_type, social_network, logger):
+            html_text, status_code = responses[social_network]
+            return html_text, status_code, None, None
+
+        with mock.patch.object(maigret, 'get_response', get_response):
+            return asyncio.run(maigret.sherlock('username',
+                                                site_data,
+                                                QueryNotify(),
+                                                logger=logging.getLogger('maigret'),
+                                                session=SherlockFakeSession()))
+
+    def test_site_error_isolation(self):
+        """Test Site Error Isolation.
+
+        This test ensures that an error while checking a single site doesn't
+        stop the search on the other sites.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if detection mechanism did not work as expected.
+        """
+
+        site_data = {
+            'Broken': {'errorType': 'unknown', 'url': 'https://broken.example/{}',
+                       'urlMain': 'https://broken.example/'},
+            'Working': {'errorType': 'status_code', 'url': 'https://working.example/{}',
+                        'urlMain': 'https://working.example/'},
+        }
+        responses = {'Broken': ('', 200), 'Working': ('', 200)}
+
+        with self.assertLogs('maigret', level='ERROR'):
+            results = self.sherlock_responses(site_data, responses)
+
+        self.assertEqual(QueryStatus.UNKNOWN, results['Broken']['status'].status)
+        self.assertEqual(QueryStatus.CLAIMED, results['Working']['status'].status)
+
+        return
+
+    def test_status_code_detection(self):
+        """Test Status Code Detection.
+
+        This test ensures that only 2XX status codes of the response mean
+        that a Username does exist for the sites detected by status code and
+        by response URL, without any requests to the sites.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if detection mechanism did not work as expected.
+        """
+
+        expected_statuses = {
+            199: QueryStatus.AVAILABLE,
+            200: QueryStatus.CLAIMED,
+            299: QueryStatus.CLAIMED,
+            300: QueryStatus.AVAILABLE,
+            404: QueryStatus.AVAILABLE,
+        }
+
+        for error_type in ('status_code', 'response_url'):
+            site_data = {
+                f'Site{status_code}': {'errorType': error_type,
+                                       'url': f'https://site{status_code}.example/{{}}',
+                                       'urlMain': f'https://site{status_code}.example/'}
+                for status_code in expected_statuses
+            }
+            responses = {f'Site{status_code}': ('', status_code)
+                         for status_code in expected_statuses}
+
+            results = self.sherlock_responses(site_data, responses)
+
+            for status_code, expected_status in expected_statuses.items():
+                with self.subTest(f"Checking {error_type} with status code {status_code}"):
+                    self.assertEqual(expected_status,
+                                     results[f'Site{status_code}']['status'].status)
+
+        return
+
+
+class SherlockResponseErrorsTests(unittest.TestCase):
+    def test_response_error_text(self):
+        """Test Response Error Text.
+
+        This test ensures that errors of requests, including subclasses of
+        the known ones, are described by the expected labels.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if an error is not described as expected.
+        """
+
+        client_exceptions = aiohttp.client_exceptions
+        expected_texts = [
+            (asyncio.TimeoutError(), "Timeout Error"),
+            (client_exceptions.ServerTimeoutError(), "Timeout Error"),
+            (ssl.SSLError(), "SSL Error"),
+            (ssl.SSLCertVerificationError(), "SSL Error"),
+            (client_exceptions.ClientConnectorSSLError(mock.Mock(), OSError()), "SSL Error"),
+            (client_exceptions.ClientConnectorCertificateError(mock.Mock(), Exception()),
+             "SSL Error"),
+            (client_exceptions.ClientConnectorError(mock.Mock(), OSError()), "Error Connecting"),
+            (aiohttp.http_exceptions.BadHttpMessage('message'), "HTTP Error"),
+            (aiohttp.http_exceptions.BadStatusLine('line'), "HTTP Error"),
+            (ValueError(), None),
+        ]
+
+        for error, expected_text in expected_texts:
+            with self.subTest(f"Checking {type(error).__name__}"):
+                self.assertEqual(expected_text, maigret.get_response_error_text(error))
+
+        return
+
+
+class SherlockSitesFilterTests(unittest.TestCase):
+    def test_filter_sites(self):
+        """Test Sites Filter.
+
+        This test ensures that the desired sites are selected regardless
+        of case, and every unknown site is reported, even after a known one.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the sites are not filtered as expected.
+        """
+
+        site_data_all = {
+            'GitHub': {'urlMain': 'https://www.github.com/'},
+            'Reddit': {'urlMain': 'https://www.reddit.com/'},
+        }
+
+        site_data, site_missing = maigret.filter_sites(site_data_all, ['GitHub', 'nosuch'])
+        self.assertEqual(['GitHub'], list(site_data))
+        self.assertEqual(['nosuch'], site_missing)
+
+        site_data, site_missing = maigret.filter_sites(site_data_all, ['reddit', 'GITHUB'])
+        self.assertEqual(['GitHub', 'Reddit'], list(site_data))
+        self.assertEqual([], site_missing)
+
+        return
+
+
+class SherlockTextFlagsTests(unittest.TestCase):
+    flags = ['Not found', 'not found', 'found', 'a.b', '(x)', 'Not found']
+
+    texts = ['', 'Page Not found', 'nothing here', 'a.b (x) not found',
+             'axb', 'Not foun', 'found it']
+
+    def check_matcher(self, flags):
+        """Check Text Flags Matcher.
+
+        Compares flags found by the matcher in the test texts with the
+        ones found by the substring search for each flag.
+
+        Keyword Arguments:
+        self                   -- This object.
+        flags                  -- List of strings to search for.
+
+        Return Value:
+        TextFlagsMatcher() object used for the check.
+        """
+
+        matcher = sites.TextFlagsMatcher(flags)
+        for text in self.texts:
+            with self.subTest(f"Checking flags {flags} in '{text}'"):
+                expected_flags = {flag for flag in flags if flag in text}
+                self.assertEqual(expected_flags, matcher.find(text))
+
+        return matcher
+
+    @unittest.skipIf(sites.ahocorasick is None, "pyahocorasick is not installed")
+    def test_automaton_search(self):
+        """Test Flags Search With Automaton.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if flags are not found as expected.
+        """
+
+        matcher = self.check_matcher(self.flags)
+        self.assertIsNotNone(matcher.automaton)
+
+        return
+
+    def test_substring_search(self):
+        """Test Flags Search With Substrings.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if flags are not found as expected.
+        """
+
+        with mock.patch.object(sites, 'ahocorasick', None):
+            matcher = self.check_matcher(self.flags[:2])
+            self.assertIsNone(matcher.automaton)
+            self.assertIsNone(matcher.regex)
+
+        return
+
+    def test_regex_search(self):
+        """Test Flags Search With Regular Expression.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if flags are not found as expected.
+        """
+
+        with mock.patch.object(sites, 'ahocorasick', None), \
+             mock.patch.object(sites, 're2', None):
+            matcher = self.check_matcher(self.flags)
+            self.assertIsNotNone(matcher.regex)
+
+        return
+
+    @unittest.skipIf(sites.re2 is None, "google-re2 is not installed")
+    def test_re2_search(self):
+        """Test Flags Search With RE2 Expression.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if flags are not found as expected.
+        """
+
+        with mock.patch.object(sites, 'ahocorasick', None):
+            matcher = self.check_matcher(self.flags)
+            self.assertEqual('re2', type(matcher.regex).__module__)
+
+        return
+
+    def test_empty_flag_search(self):
+        """Test Search Of Empty Flag.
+
+        Empty flag is found in any text, including the empty one.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if flags are not found as expected.
+        """
+
+        for automaton in (sites.ahocorasick, None):
+            with mock.patch.object(sites, 'ahocorasick', automaton):
+                self.check_matcher(self.flags + [''])
+                self.assertEqual(set(), sites.TextFlagsMatcher([]).find('text'))
+
+        return
+
+
+class SherlockUrlTemplateTests(unittest.TestCase):
+    def test_url_template(self):
+        """Test URL Template.
+
+        This test ensures that the "%" characters of site URLs stay
+        unchanged when the username is substituted.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the URL is not built as expected.
+        """
+
+        urls = {
+            'https://example.com/{}': 'https://example.com/user',
+            'https://example.com/%40{}/': 'https://example.com/%40user/',
+            'https://example.com/?q={}&p=100%': 'https://example.com/?q=user&p=100%',
+        }
+
+        for url, expected_url in urls.items():
+            with self.subTest(f"Checking URL '{url}'"):
+                self.assertEqual(expected_url, sites.url_template(url) % ('user',))
+                self.assertEqual(url.format('user'), sites.url_template(url) % ('user',))
+
+        return
+
+
+class SherlockResultsCacheTests(unittest.TestCase):
+    def setUp(self):
+        """Sherlock Results Cache Test Setup.
+
+        Creates the cache in a temporary folder.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.folder = tempfile.TemporaryDirectory()
+        self.results_cache = cache.ResultsCache(os.path.join(self.folder.name, 'cache.db'),
+                                                ttl=3600)
+        self.sites_hash = cache.sites_fingerprint(['GitHub', 'Reddit'])
+        self.results = {
+            'GitHub': {
+                'url_main': 'https://www.github.com/',
+                'url_user': 'https://www.github.com/username',
+                'status': QueryResult('username', 'GitHub',
+                                      'https://www.github.com/username',
+                                      QueryStatus.CLAIMED),
+                'http_status': 200,
+                'response_text': None,
+            },
+        }
+
+        return
+
+    def tearDown(self):
+        """Sherlock Results Cache Test Teardown.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.results_cache.close()
+        self.folder.cleanup()
+
+        return
+
+    def test_saved_results(self):
+        """Test Saved Results.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the results are not saved as expected.
+        """
+
+        key = self.results_cache.key('UserName', 'username', self.sites_hash)
+        self.assertIsNone(self.results_cache.get(key))
+
+        self.results_cache.set(key, self.results)
+        results = self.results_cache.get(key)
+        self.assertEqual(self.results.keys(), results.keys())
+        self.assertEqual(QueryStatus.CLAIMED, results['GitHub']['status'].status)
+        self.assertEqual(200, results['GitHub']['http_status'])
+
+        return
+
+    def test_results_expiration(self):
+        """Test Results Expiration.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the results are valid after ttl.
+        """
+
+        key = self.results_cache.key('username', 'username', self.sites_hash)
+        self.results_cache.set(key, self.results)
+
+        now = time.time()
+        with mock.patch.object(cache.time, 'time', return_value=now + 3500):
+            self.assertIsNotNone(self.results_cache.get(key))
+        with mock.patch.object(cache.time, 'time', return_value=now + 3700):
+            self.assertIsNone(self.results_cache.get(key))
+
+        return
+
+    def test_cache_key(self):
+        """Test Cache Key.
+
+        This test ensures that results are shared only by the searches of
+        the same username with the same parameters.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the keys are not built as expected.
+        """
+
+        key = self.results_cache.key('username', 'username', self.sites_hash)
+
+        self.assertEqual(key, self.results_cache.key('UserName', 'username', self.sites_hash))
+        self.assertEqual(self.sites_hash, cache.sites_fingerprint(['Reddit', 'GitHub']))
+
+        other_keys = [
+            self.results_cache.key('username2', 'username', self.sites_hash),
+            self.results_cache.key('username', 'vk_id', self.sites_hash),
+            self.results_cache.key('username', 'username', cache.sites_fingerprint(['GitHub'])),
+            self.results_cache.key('username', 'username',
+                                   cache.sites_fingerprint(['GitHub', 'Reddit'], {'us'})),
+            self.results_cache.key('username', 'username', self.sites_hash, ids_search=True),
+        ]
+        for other_key in other_keys:
+            self.assertNotEqual(key, other_key)
+
+        return
+
+
+class SherlockResultsBatchTests(unittest.TestCase):
+    def test_commit_batch(self):
+        """Test Commit Batch.
+
+        This test ensures that the saved results are committed once the
+        batch is full, and the rest of them when the store is closed.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the results are not committed as expected.
+        """
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'state.db')
+            sites_hash = cache.sites_fingerprint(['GitHub', 'Reddit'])
+            results = {'GitHub': {'http_status': 200}}
+
+            search_state = cache.ResultsCache(path, ttl=3600, commit_batch=2)
+            keys = [search_state.key(username, 'username', sites_hash)
+                    for username in ('alice', 'bob', 'carol')]
+
+            search_state.set(keys[0], results)
+            other_state = cache.ResultsCache(path, ttl=3600)
+            self.assertIsNone(other_state.get(keys[0]))
+            other_state.close()
+
+            search_state.set(keys[1], results)
+            search_state.set(keys[2], results)
+            other_state = cache.ResultsCache(path, ttl=3600)
+            self.assertEqual(results, other_state.get(keys[1]))
+            self.assertIsNone(other_state.get(keys[2]))
+            other_state.close()
+
+            search_state.close()
+            other_state = cache.ResultsCache(path, ttl=3600)
+            self.assertEqual(results, other_state.get(keys[2]))
+            other_state.close()
+
+        return
+
+
+class SherlockMainTests(unittest.TestCase):
+    def setUp(self):
+        """Sherlock Main Test Setup.
+
+        Runs the search in a temporary folder, with the site data of two
+        sites saved in it.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        self.folder = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder.name)
+
+        self.json_file = os.path.join(self.folder.name, 'data.json')
+        with open(self.json_file, 'w') as file:
+            json.dump({
+                site: {'errorType': 'status_code',
+                       'url': f'https://{site.lower()}.example/{{}}',
+                       'urlMain': f'https://{site.lower()}.example/',
+                       'username_claimed': 'claimed',
+                       'username_unclaimed': 'unclaimed'}
+                for site in ('First', 'Second')
+            }, file)
+
+        # Searches made by the stubbed sherlock() with their notify objects
+        # and searched sites
+        self.searches = []
+
+        # Sites which fail to answer to the stubbed sherlock()
+        self.unknown_sites = set()
+
+        return
+
+    def tearDown(self):
+        """Sherlock Main Test Teardown.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        Nothing.
+        """
+
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+        return
+
+    def run_main(self, arguments, accounts):
+        """Run Main With Stubbed Sherlock.
+
+        Keyword Arguments:
+        self                   -- This object.
+        arguments              -- List of strings containing command line
+                                  arguments.
+        accounts               -- Dictionary with username as key and
+                                  dictionary of usernames found in the page
+                                  by site name of claimed accounts as value.
+
+        Return Value:
+        Nothing.
+        """
+
+        async def sherlock(username, site_data, query_notify, logger, **kwargs):
+            self.searches.append((username, query_notify, list(site_data)))
+            query_notify.start(username, kwargs.get('id_type', 'username'))
+
+            results = {}
+            for site_name, information in site_data.items():
+                url = information['url'].format(username)
+                ids_usernames = accounts.get(username, {}).get(site_name)
+                if site_name in self.unknown_sites:
+                    status = QueryStatus.UNKNOWN
+                elif ids_usernames is None:
+                    status = QueryStatus.AVAILABLE
+                else:
+                    status = QueryStatus.CLAIMED
+                result = QueryResult(username, site_name, url, status)
+                query_notify.update(result)
+
+                results[site_name] = {'url_main': information['urlMain'],
+                                      'url_user': url,
+                                      'status': result,
+                                      'http_status': 200,
+                                      'response_text': None}
+                if ids_usernames:
+                    results[site_name]['ids_usernames'] = ids_usernames
+
+            query_notify.finish()
+            return results
+
+        argv = ['maigret', '--json', self.json_file, '--no-color', *arguments]
+        with mock.patch.object(maigret, 'sherlock', sherlock), \
+             mock.patch.object(sys, 'argv', argv), \
+             mock.patch('sys.stdout'):
+            asyncio.run(maigret.main())
+
+        return
+
+    def test_usernames_waves(self):
+        """Test Usernames Waves.
+
+        This test ensures that a single username is notified about as the
+        results come, simultaneous ones are notified about later, and every
+        username found by ids search is searched once.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the usernames are not searched as expected.
+        """
+
+        accounts = {
+            'alice': {'First': {'bob': 'username', 'carol': 'username'},
+                      'Second': {'Bob': 'username', 'alice': 'username'}},
+            'bob': {'First': {'carol': 'username'}},
+            'carol': {'Second': {'bob': 'username'}},
+        }
+        self.run_main(['alice'], accounts)
+
+        searched_usernames = [username for username, _, _ in self.searches]
+        self.assertEqual('alice', searched_usernames[0])
+        self.assertEqual(['alice', 'bob', 'carol'], sorted(searched_usernames))
+
+        self.assertIsInstance(self.searches[0][1], QueryNotifyPrint)
+        for _, notify, _ in self.searches[1:]:
+            self.assertIsInstance(notify, QueryNotifyDeferred)
+
+        return
+
+    def test_cached_unknown_results(self):
+        """Test Cached Unknown Results.
+
+        This test ensures that the sites which failed to answer are requested
+        again by the next search with --cache, and the saved results of the
+        other sites are reused.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the sites are not searched as expected.
+        """
+
+        accounts = {'alice': {'First': {}, 'Second': {}}}
+
+        with mock.patch.dict(os.environ, {'HOME': self.folder.name}):
+            self.unknown_sites = {'Second'}
+            self.run_main(['--cache', 'alice'], accounts)
+
+            self.unknown_sites = set()
+            self.run_main(['--cache', 'alice'], accounts)
+            self.run_main(['--cache', 'alice'], accounts)
+
+        self.assertEqual([['First', 'Second'], ['Second']],
+                         [site_names for _, _, site_names in self.searches])
+        with open('alice.txt', encoding='utf-8') as file:
+            self.assertEqual('https://first.example/alice\n'
+                             'https://second.example/alice\n'
+                             'Total Websites Username Detected On : 2',
+                             file.read())
+
+        return
+
+    def test_resumed_cached_results(self):
+        """Test Resumed Cached Results.
+
+        This test ensures that the results taken from --cache are saved for
+        --resume, and the sites which failed to answer are requested again
+        by the next search with --resume.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the sites are not searched as expected.
+        """
+
+        accounts = {'alice': {'First': {}, 'Second': {}}}
+
+        with mock.patch.dict(os.environ, {'HOME': self.folder.name}):
+            self.unknown_sites = {'Second'}
+            self.run_main(['--cache', 'alice'], accounts)
+            self.run_main(['--cache', '--resume', 'alice'], accounts)
+
+            self.unknown_sites = set()
+            self.run_main(['--resume', 'alice'], accounts)
+            self.run_main(['--resume', 'alice'], accounts)
+
+        self.assertEqual([['First', 'Second'], ['Second'], ['Second']],
+                         [site_names for _, _, site_names in self.searches])
+
+        return
+
+    def test_single_username_output(self):
+        """Test Single Username Output.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the output file is not written as expected.
+        """
+
+        self.run_main(['-o', 'output.txt', 'alice'], {'alice': {'First': {}}})
+
+        with open('output.txt', encoding='utf-8') as file:
+            self.assertEqual('https://first.example/alice\n'
+                             'Total Websites Username Detected On : 1',
+                             file.read())
+
+        return
+
+    def test_several_usernames_output(self):
+        """Test Several Usernames Output.
+
+        This test ensures that the usernames found by ids search are added
+        to the output file under their names.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if the output file is not written as expected.
+        """
+
+        accounts = {
+            'alice': {'First': {'bob': 'username'}},
+            'bob': {'First': {}, 'Second': {}},
+        }
+        self.run_main(['-o', 'output.txt', 'alice'], accounts)
+
+        with open('output.txt', encoding='utf-8') as file:
+            self.assertEqual('Username: alice\n'
+                             'https://first.example/alice\n'
+                             'Total Websites Username Detected On : 1\n'
+                             'Username: bob\n'
+                             'https://first.example/bob\n'
+                             'https://second.example/bob\n'
+                             'Total Websites Username Detected On : 2\n',
+                             file.read())
+
+        return
+
+
+class SherlockQueryNotifyDeferredTests(unittest.TestCase):
+    def test_flush(self):
+        """Test Deferred Notifications Flush.
+
+        Keyword Arguments:
+        self                   -- This object.
+
+        Return Value:
+        N/A.
+        Will trigger an assert if notifications are not replayed as expected.
+        """
+
+        notifications = []
+
+        class QueryNotifyRecord(QueryNotify):
+            def start(self, message=None, id_type='username'):
+                notifications.append(('start', message, id_type))
+
+            def update(self, result):
+                notifications.append(('update', result))
+
+            def finish(self, message=None):
+                notifications.append(('finish', message))
+
+        results = [QueryResult('username', site, f'https://{site}.example/username',
+                               QueryStatus.CLAIMED)
+                   for site in ('first', 'second')]
+
+        notify = QueryNotifyDeferred(QueryNotifyRecord())
+        notify.start('username', 'vk_id')
+        for result in results:
+            notify.update(result)
+        notify.finish()
+        self.assertEqual([], notifications)
+
+        notify.flush()
+        self.assertEqual([('start', 'username', 'vk_id'),
+                          ('update', results[0]),
+                          ('update', results[1]),
+                          ('finish', None)],
+                         notifications)
+
+        notify.flush()
+        self.assertEqual(4, len(notifications))
+
+        return
+
+
 class SherlockDetectTests(SherlockBaseTest):
     def test_detect_true_via_message(self):
         """Test Username Does Exist (Via Message).
@@ -2,6 +2,8 @@
 
 This module contains various utilities for running tests.
 """
+import asyncio
+import logging
 import os
 import os.path
 import unittest
@@ -113,13 +115,14 @@ class SherlockBaseTest(unittest.TestCase):
             exist_result_desired = QueryStatus.AVAILABLE
 
         for username in username_list:
-            results = maigret.sherlock(username,
-                                        site_data,
-                                        self.query_notify,
-                                        tor=self.tor,
-                                        unique_tor=self.unique_tor,
-                                        timeout=self.timeout
-                                       )
+            results = asyncio.run(maigret.sherlock(username,
+                                                   site_data,
+                                                   self.query_notify,
+                                                   logger=logging.getLogger('maigret'),
+                                                   tor=self.tor,
+                                                   unique_tor=self.unique_tor,
+                                                   timeout=self.timeout
+                                                  ))
             for site, result in results.items():
                 with self.subTest(f"Checking Username '{username}' "
                                   f"{check_type_text} on Site '{site}'"